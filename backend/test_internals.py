@@ -0,0 +1,171 @@
+import asyncio
+import json
+import random
+import time
+from types import SimpleNamespace
+from fastapi.testclient import TestClient
+import main
+from main import (
+    AsyncTokenBucket,
+    ReviewRequest,
+    _ReviewSectionScanner,
+    _cache_key,
+    parse_review_response,
+)
+
+# Offline checks for the parsing, caching, pacing and batching helpers; no Groq calls are made.
+
+SAMPLE_REVIEW = """Here is my review.
+- preamble bullet that belongs to no section
+
+🔴 Critical Issues
+- SQL built with string concatenation
+* Password stored in plain text
+---
+
+🟠 High Priority
+  •   Unbounded loop on retry
+-
+**Note:** not a bullet
+
+🟡 Medium Priority
+None
+
+🟢 Low Priority
+- Rename `x` to something descriptive
+
+🔴 Critical Issues
+- duplicate header, ignored by both parsers
+
+📌 Overall Summary
+Mostly fine, but fix the SQL first.
+"""
+
+
+def _completion(content):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+def _scan(text, sizes):
+    scanner = _ReviewSectionScanner()
+    events = []
+    pos = 0
+    for size in sizes:
+        events += scanner.feed(text[pos:pos + size])
+        pos += size
+    events += scanner.feed(text[pos:])
+    events += scanner.finish()
+    sections = {"critical": [], "high": [], "medium": [], "low": [], "summary": ""}
+    for event in events:
+        sections[event["section"]] = event["content"]
+    return sections
+
+
+def test_scanner_matches_parser():
+    expected = parse_review_response(SAMPLE_REVIEW)
+    assert expected["critical"] == ["SQL built with string concatenation", "Password stored in plain text"]
+    assert expected["high"] == ["Unbounded loop on retry"]
+    rng = random.Random(0)
+    for _ in range(200):
+        sizes = [rng.randint(1, 12) for _ in range(rng.randint(0, 80))]
+        assert _scan(SAMPLE_REVIEW, sizes) == expected
+    # One character at a time splits every header across deltas
+    assert _scan(SAMPLE_REVIEW, [1] * len(SAMPLE_REVIEW)) == expected
+
+
+def test_cache_key_fields_do_not_collide():
+    keys = {
+        _cache_key("review", "ab", "c", []),
+        _cache_key("review", "b", "ca", []),
+        _cache_key("review", "ab", "c", ["x"]),
+        _cache_key("review", "ab", "c", ["x", ""]),
+        _cache_key("review", "x\0ab", "c", []),
+        _cache_key("rewrite", "ab", "c", []),
+        _cache_key("review", "", "c", ["ab"]),
+    }
+    assert len(keys) == 7
+    assert _cache_key("review", "ab", "c", ["a", "b"]) == _cache_key("review", "ab", "c", ["b", "a"])
+    assert _cache_key("review", "ab", "c", None) == _cache_key("review", "ab", "c", [])
+
+
+def test_token_bucket():
+    async def run():
+        # Disabled limiter never waits
+        start = time.monotonic()
+        await AsyncTokenBucket(0, 0).acquire(10_000)
+        assert time.monotonic() - start < 0.05
+
+        # A single call above the whole minute's token budget is clamped instead of waiting forever
+        bucket = AsyncTokenBucket(0, 100)
+        await asyncio.wait_for(bucket.acquire(1_000), 0.5)
+
+        # 120 rpm: the full bucket is available at once, the next request waits ~0.5 s for a refill
+        bucket = AsyncTokenBucket(120, 0)
+        start = time.monotonic()
+        for _ in range(120):
+            await bucket.acquire()
+        assert time.monotonic() - start < 0.05
+        await bucket.acquire()
+        assert 0.4 < time.monotonic() - start < 1.0
+
+    asyncio.run(run())
+
+
+def test_review_batcher():
+    calls = []
+
+    async def fake_create(messages, **kwargs):
+        calls.append(messages)
+        if messages[0]["content"] == main.REVIEW_BATCH_SYSTEM_PROMPT:
+            # Answer the first submission only, so the second falls back to a single review
+            return _completion(json.dumps({"reviews": [{"id": 1, "critical": ["batched"]}]}))
+        return _completion(json.dumps({"low": ["single"]}))
+
+    async def run():
+        main._review_queue = asyncio.Queue()
+        batcher = asyncio.create_task(main._review_batcher())
+        try:
+            return await asyncio.gather(
+                main._submit_review(ReviewRequest(code="a = 1", language="python", focus_areas=["bugs"])),
+                main._submit_review(ReviewRequest(code="b = 2", language="python", focus_areas=["bugs"])),
+            )
+        finally:
+            batcher.cancel()
+            main._review_queue = None
+
+    original = (main.client.chat.completions.create, main.REVIEW_BATCH_WINDOW_MS)
+    main.client.chat.completions.create, main.REVIEW_BATCH_WINDOW_MS = fake_create, 50
+    try:
+        first, second = asyncio.run(run())
+    finally:
+        main.client.chat.completions.create, main.REVIEW_BATCH_WINDOW_MS = original
+
+    assert first["critical"] == ["batched"]
+    assert second["low"] == ["single"]
+    # One merged call for both submissions, then one retry for the skipped one
+    assert len(calls) == 2
+    assert "### REQ 2" in calls[0][1]["content"]
+    assert not main._batch_tasks
+
+
+def test_body_size_limit():
+    original = main.MAX_BODY_BYTES
+    main.MAX_BODY_BYTES = 100
+    try:
+        with TestClient(main.app) as client:
+            response = client.post("/api/review", json={"code": "x" * 200, "language": "python", "focus_areas": []})
+            assert response.status_code == 413
+            assert response.json() == {"detail": "Request body too large"}
+            # Non-API paths are not limited
+            assert client.post("/", content=b"x" * 200).status_code != 413
+    finally:
+        main.MAX_BODY_BYTES = original
+
+
+if __name__ == "__main__":
+    test_scanner_matches_parser()
+    test_cache_key_fields_do_not_collide()
+    test_token_bucket()
+    test_review_batcher()
+    test_body_size_limit()
+    print("All internal checks passed.")
@@ -1,23 +1,103 @@
 import os
 import re
-from typing import List, Optional
-from fastapi import FastAPI, HTTPException, Request
-from fastapi.responses import HTMLResponse, JSONResponse
+import sys
+import time
+import json
+import queue
+import logging
+import logging.handlers
+import asyncio
+import hashlib
+import httpx
+import orjson
+from typing import Annotated, List, Optional
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.responses import HTMLResponse, ORJSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.middleware.gzip import GZipMiddleware
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import Headers
+from pydantic import BaseModel, Field, StringConstraints, ValidationError
 from dotenv import load_dotenv
-from groq import Groq
+from groq import AsyncGroq
+from cachetools import TTLCache
 
 # Load environment variables
 load_dotenv()
 
+# Log records go through a queue so handler I/O runs on the listener thread, not the event loop
+logger = logging.getLogger(__name__)
+logger.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
+logger.propagate = False
+_log_queue = queue.SimpleQueue()
+logger.addHandler(logging.handlers.QueueHandler(_log_queue))
+_log_listener = logging.handlers.QueueListener(_log_queue, logging.StreamHandler())
+
+# Shared connection pool so TCP/TLS to the Groq API is reused across requests
+_http = httpx.AsyncClient(
+    http2=True,
+    limits=httpx.Limits(max_connections=200, max_keepalive_connections=100),
+    timeout=httpx.Timeout(60, connect=10),
+)
+
 # Initialize Groq client
-client = Groq(
+client = AsyncGroq(
     api_key=os.environ.get("GROQ_API_KEY"),
+    http_client=_http,
 )
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
+
+@app.on_event("startup")
+async def start_log_listener():
+    _log_listener.start()
+
+@app.on_event("shutdown")
+async def stop_log_listener():
+    _log_listener.stop()
+
+@app.on_event("shutdown")
+async def close_http_client():
+    await _http.aclose()
+
+_prewarm_task = None
+
+async def _prewarm_groq():
+    # models.list() is free and opens the pooled TLS/HTTP2 connection before the first user request
+    try:
+        await client.models.list()
+    except Exception:
+        logger.warning("Groq prewarm failed", exc_info=True)
+
+@app.on_event("startup")
+async def prewarm_groq():
+    # Run in the background so a slow or unreachable API doesn't hold up startup
+    global _prewarm_task
+    _prewarm_task = asyncio.create_task(_prewarm_groq())
+
+# Largest request body accepted on /api/*; checked from Content-Length before the body is read or parsed
+MAX_BODY_BYTES = int(os.environ.get("MAX_BODY_BYTES", str(1024 * 1024)))
+
+
+class _BodySizeLimitMiddleware:
+    """Rejects oversized /api/* requests with 413 up front. Added before CORS so the error still carries CORS headers."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].startswith("/api/"):
+            length = Headers(scope=scope).get("content-length")
+            if length and length.isdigit() and int(length) > MAX_BODY_BYTES:
+                response = ORJSONResponse(status_code=413, content={"detail": "Request body too large"})
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+app.add_middleware(_BodySizeLimitMiddleware)
 
 # Enable CORS
 app.add_middleware(
@@ -28,51 +108,215 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+class _BufferedGZipMiddleware(GZipMiddleware):
+    """GZip for buffered JSON/HTML; streamed routes pass through so tokens are not held in the compressor."""
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "") if scope["type"] == "http" else ""
+        if path == "/api/chat" or path.endswith("/stream"):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+# Compress large review/rewrite payloads
+app.add_middleware(_BufferedGZipMiddleware, minimum_size=1024)
+
 # Serve static files for frontend
 app.mount("/static", StaticFiles(directory="../frontend"), name="static")
 
 # Models
+# Length limits are enforced by pydantic-core during parsing
+CodeStr = Annotated[str, StringConstraints(max_length=200_000)]
+LanguageStr = Annotated[str, StringConstraints(max_length=32)]
+FocusAreas = Annotated[List[str], Field(max_length=16)]
+
 class ReviewRequest(BaseModel):
-    code: str
-    language: str
-    focus_areas: List[str]
+    code: CodeStr
+    language: LanguageStr
+    focus_areas: FocusAreas
 
 class RewriteRequest(BaseModel):
-    code: str
-    language: str
-    focus_areas: Optional[List[str]] = []
+    code: CodeStr
+    language: LanguageStr
+    focus_areas: Optional[FocusAreas] = []
 
 class ChatRequest(BaseModel):
-    message: str
-    language: Optional[str] = None
-    context_code: Optional[str] = None
-    review_summary: Optional[str] = None
+    message: Annotated[str, StringConstraints(max_length=8000)]
+    language: Optional[LanguageStr] = None
+    context_code: Optional[CodeStr] = None
+    review_summary: Optional[Annotated[str, StringConstraints(max_length=20_000)]] = None
 
 class ScoreRequest(BaseModel):
-    code: str
-    language: str
+    code: CodeStr
+    language: LanguageStr
+
+class ReviewResult(BaseModel):
+    critical: List[str] = []
+    high: List[str] = []
+    medium: List[str] = []
+    low: List[str] = []
+    summary: str = ""
+
+# --- Response Cache ---
+
+# Exact-match cache for review/rewrite results, keyed by the request contents
+_response_cache = TTLCache(maxsize=2048, ttl=3600)
+_inflight_locks = {}
+
+def _cache_key(kind: str, code: str, language: str, focus_areas: Optional[List[str]]) -> str:
+    # Hash field by field so large code isn't copied into an intermediate joined string.
+    # Each field is length-prefixed (not separator-delimited) since request strings may contain any character.
+    focus = sorted(focus_areas or [])
+    h = hashlib.blake2b()
+    h.update(len(focus).to_bytes(8, "little"))
+    for field in (kind, language, *focus, code):
+        data = field.encode("utf-8")
+        h.update(len(data).to_bytes(8, "little"))
+        h.update(data)
+    return h.hexdigest()
+
+async def _cached(key: str, compute):
+    """
+    Returns the cached result for key, or computes and stores it.
+    Concurrent requests for the same key wait on one LLM call instead of each issuing their own.
+    """
+    if key in _response_cache:
+        return _response_cache[key]
+
+    lock = _inflight_locks.setdefault(key, asyncio.Lock())
+    try:
+        async with lock:
+            if key in _response_cache:
+                return _response_cache[key]
+            result = await compute()
+            _response_cache[key] = result
+            return result
+    finally:
+        if _inflight_locks.get(key) is lock and not lock.locked():
+            del _inflight_locks[key]
+
+# --- Rate Limiting ---
+
+# Worker processes (uvicorn reads the same variable). Limits, caches and request coalescing below are per worker.
+WEB_CONCURRENCY = max(1, int(os.environ.get("WEB_CONCURRENCY", "1")))
+
+# Caps in-flight Groq calls and per-client request rate so one user can't exhaust the quota
+GROQ_MAX_CONCURRENCY = int(os.environ.get("GROQ_MAX_CONCURRENCY", "32"))
+RATE_LIMIT_PER_MINUTE = int(os.environ.get("RATE_LIMIT_PER_MINUTE", "30"))
+
+_GROQ_SEM = asyncio.Semaphore(GROQ_MAX_CONCURRENCY)
+_rate_buckets = TTLCache(maxsize=10_000, ttl=600)
+
+def _charge_rate_limit(http_request: Request, cost: int = 1):
+    """
+    Token bucket per client IP; takes `cost` tokens or rejects the request with 429.
+    Must be called from the event loop (never a worker thread) so the read-modify-write can't interleave.
+    """
+    ip = http_request.client.host if http_request.client else "unknown"
+    now = time.monotonic()
+    tokens, last = _rate_buckets.get(ip, (RATE_LIMIT_PER_MINUTE, now))
+    tokens = min(RATE_LIMIT_PER_MINUTE, tokens + (now - last) * RATE_LIMIT_PER_MINUTE / 60)
+    if tokens < cost:
+        _rate_buckets[ip] = (tokens, now)
+        raise HTTPException(status_code=429, detail="Rate limit exceeded. Please try again later.")
+    _rate_buckets[ip] = (tokens - cost, now)
+
+async def _rate_limit(http_request: Request):
+    # Async with no awaits, so FastAPI runs it on the event loop rather than the threadpool
+    _charge_rate_limit(http_request)
+
+# Opt-in: proactively pace Groq calls under the account's RPM/TPM quota instead of eating 429s (0 = off)
+GROQ_RPM = int(os.environ.get("GROQ_RPM", "0"))
+GROQ_TPM = int(os.environ.get("GROQ_TPM", "0"))
+
+class AsyncTokenBucket:
+    """
+    Request and token buckets refilled continuously; acquire() waits until both have capacity.
+    """
+
+    def __init__(self, rpm: int, tpm: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._requests = float(rpm)
+        self._tokens = float(tpm)
+        self._last = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._last
+        self._last = now
+        if self.rpm:
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    async def acquire(self, tokens: int = 0):
+        if not self.rpm and not self.tpm:
+            return
+        # A single call larger than the whole minute's budget would otherwise wait forever
+        tokens = min(tokens, self.tpm) if self.tpm else 0
+        # The lock keeps waiters in arrival order
+        async with self._lock:
+            while True:
+                self._refill()
+                wait = 0.0
+                if self.rpm and self._requests < 1:
+                    wait = (1 - self._requests) * 60 / self.rpm
+                if self.tpm and self._tokens < tokens:
+                    wait = max(wait, (tokens - self._tokens) * 60 / self.tpm)
+                if not wait:
+                    break
+                await asyncio.sleep(wait)
+            if self.rpm:
+                self._requests -= 1
+            self._tokens -= tokens
+
+def _per_worker(limit: int) -> int:
+    # Every worker paces independently, so each gets an even share of the account quota (at least 1, since 0 means off)
+    return max(1, limit // WEB_CONCURRENCY) if limit else 0
+
+_groq_limiter = AsyncTokenBucket(_per_worker(GROQ_RPM), _per_worker(GROQ_TPM))
+
+@asynccontextmanager
+async def _groq_slot(prompt: str, max_tokens: int):
+    """
+    Waits for quota (prompt estimated at ~4 chars per token, plus the completion budget), then a concurrency slot.
+    """
+    await _groq_limiter.acquire(len(prompt) // 4 + max_tokens)
+    async with _GROQ_SEM:
+        yield
+
+def _prompt_text(messages) -> str:
+    # Everything sent counts against the token quota, system prompt included
+    return "".join(m["content"] for m in messages)
 
 # --- API Endpoints ---
 
+# Page contents are read once at startup instead of on every request
+_LOGIN_HTML = b""
+_INDEX_HTML = b""
+
+@app.on_event("startup")
+async def load_pages():
+    global _LOGIN_HTML, _INDEX_HTML
+    with open("../frontend/login.html", "rb") as f:
+        _LOGIN_HTML = f.read()
+    with open("../frontend/index.html", "rb") as f:
+        _INDEX_HTML = f.read()
+
 @app.get("/", response_class=HTMLResponse)
 async def read_root():
-    with open("../frontend/login.html", "r", encoding="utf-8") as f:
-        return f.read()
+    return HTMLResponse(content=_LOGIN_HTML)
 
 @app.get("/app", response_class=HTMLResponse)
 async def read_app():
-    with open("../frontend/index.html", "r", encoding="utf-8") as f:
-        return f.read()
-
-@app.post("/api/review")
-async def review_code(request: ReviewRequest):
-    try:
-        prompt = f"""You are a senior software engineer with 15+ years of experience.
-Analyze the following {request.language} code focusing on: {', '.join(request.focus_areas)}.
-
-Provide output in EXACT structure:
+    return HTMLResponse(content=_INDEX_HTML)
 
-🔴 Critical Issues
+# Section layout every review response must follow
+REVIEW_SECTIONS = """🔴 Critical Issues
 
 bullet points
 
@@ -90,44 +334,260 @@ bullet points
 
 📌 Overall Summary
 
-Short summary paragraph.
+Short summary paragraph."""
+
+# JSON shape requested from the model when the review is returned in one piece
+REVIEW_JSON_SCHEMA = """{
+  "critical": ["critical issue", ...],
+  "high": ["high priority issue", ...],
+  "medium": ["medium priority issue", ...],
+  "low": ["low priority issue", ...],
+  "summary": "short summary paragraph"
+}"""
+
+# Static system prompts: identical bytes on every call so the provider can reuse the cached prefix
+REVIEW_SYSTEM_PROMPT = f"""You are a senior software engineer with 15+ years of experience.
+Analyze the code in the user message, focusing on the requested areas.
+
+Provide output in EXACT structure:
+
+{REVIEW_SECTIONS}"""
+
+REVIEW_JSON_SYSTEM_PROMPT = f"""You are a senior software engineer with 15+ years of experience.
+Analyze the code in the user message, focusing on the requested areas.
+
+Respond with a single JSON object with exactly these keys:
 
-Code:
+{REVIEW_JSON_SCHEMA}"""
+
+def _max_tokens(code: str, floor: int, cap: int = 2000) -> int:
+    """
+    Sizes the completion budget from the input (about 4 characters per token) so short snippets don't reserve the full cap.
+    """
+    return min(cap, floor + int(len(code) // 4 * 1.2))
 
-{request.code}
-"""
-        completion = client.chat.completions.create(
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt,
-                }
-            ],
+def _clip(code: str, n: int = 32_000) -> str:
+    """
+    Keeps the head and tail of oversized code so one huge paste can't blow up prompt size.
+    """
+    return code if len(code) <= n else code[:n // 2] + "\n...[truncated]...\n" + code[-n // 2:]
+
+def _review_messages(request: ReviewRequest, json_mode: bool = False):
+    return [
+        {
+            "role": "system",
+            "content": REVIEW_JSON_SYSTEM_PROMPT if json_mode else REVIEW_SYSTEM_PROMPT,
+        },
+        {
+            "role": "user",
+            "content": f"Language: {request.language}\nFocus: {', '.join(request.focus_areas)}\nCode:\n{_clip(request.code)}",
+        },
+    ]
+
+def _review_result(review_text: str):
+    parsed_review = parse_review_response(review_text)
+    parsed_review["raw_review"] = review_text
+    return parsed_review
+
+def _review_markdown(review: ReviewResult) -> str:
+    """
+    Renders a structured review back into the sectioned markdown the frontend displays.
+    """
+    parts = []
+    for header, key in _SECTION_KEYS.items():
+        if key == "summary":
+            body = review.summary
+        else:
+            body = "\n".join(f"- {item}" for item in getattr(review, key)) or "None"
+        parts.append(f"{header}\n\n{body}")
+    return "\n\n".join(parts)
+
+def _review_payload(review: ReviewResult):
+    result = review.model_dump()
+    result["raw_review"] = _review_markdown(review)
+    return result
+
+async def _generate_review(request: ReviewRequest):
+    # JSON mode makes the model emit the sections directly, so no text parsing is needed
+    messages = _review_messages(request, json_mode=True)
+    max_tokens = _max_tokens(request.code, floor=600)
+    async with _groq_slot(_prompt_text(messages), max_tokens):
+        completion = await client.chat.completions.create(
+            messages=messages,
             model="llama-3.3-70b-versatile",
             temperature=0.3,
-            max_tokens=2000,
+            max_tokens=max_tokens,
             top_p=0.9,
+            response_format={"type": "json_object"},
         )
-        
-        review_text = completion.choices[0].message.content
-        parsed_review = parse_review_response(review_text)
-        parsed_review["raw_review"] = review_text
-        
-        return JSONResponse(content=parsed_review)
 
+    review_text = completion.choices[0].message.content
+    try:
+        return _review_payload(ReviewResult.model_validate_json(review_text))
+    except ValidationError:
+        # Usually a reply cut off at max_tokens; salvage what the text parser can find
+        logger.warning("Review JSON did not validate; falling back to text parsing")
+        return _review_result(review_text)
+
+# --- Review Micro-Batching ---
+
+# Opt-in: when REVIEW_BATCH_WINDOW_MS > 0, reviews arriving within the window share one Groq call
+REVIEW_BATCH_WINDOW_MS = int(os.environ.get("REVIEW_BATCH_WINDOW_MS", "0"))
+REVIEW_BATCH_MAX = int(os.environ.get("REVIEW_BATCH_MAX", "4"))
+
+_review_queue = None
+_review_batcher_task = None
+# The event loop only keeps weak references to tasks, so in-flight batches are held here until they finish
+_batch_tasks = set()
+
+def _spawn_batch(batch):
+    task = asyncio.create_task(_run_review_batch(batch))
+    _batch_tasks.add(task)
+    task.add_done_callback(_batch_tasks.discard)
+
+REVIEW_BATCH_SYSTEM_PROMPT = f"""You are a senior software engineer with 15+ years of experience.
+Review each code submission in the user message independently, focusing on its listed areas.
+
+Respond with a single JSON object of the form {{"reviews": [...]}} holding one entry per submission.
+Each entry must have an "id" key with the submission number plus exactly these keys:
+
+{REVIEW_JSON_SCHEMA}"""
+
+@app.on_event("startup")
+async def start_review_batcher():
+    global _review_queue, _review_batcher_task
+    if REVIEW_BATCH_WINDOW_MS > 0:
+        _review_queue = asyncio.Queue()
+        _review_batcher_task = asyncio.create_task(_review_batcher())
+
+@app.on_event("shutdown")
+async def stop_review_batcher():
+    if _review_batcher_task is not None:
+        _review_batcher_task.cancel()
+
+async def _review_batcher():
+    """
+    Drains queued review requests, grouping those that arrive within the batch window.
+    """
+    loop = asyncio.get_running_loop()
+    window = REVIEW_BATCH_WINDOW_MS / 1000
+    while True:
+        batch = [await _review_queue.get()]
+        deadline = loop.time() + window
+        while len(batch) < REVIEW_BATCH_MAX:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(_review_queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        _spawn_batch(batch)
+
+async def _run_review_batch(batch):
+    if len(batch) == 1:
+        request, fut = batch[0]
+        try:
+            result = await _generate_review(request)
+        except Exception as e:
+            if not fut.done():
+                fut.set_exception(e)
+        else:
+            if not fut.done():
+                fut.set_result(result)
+        return
+
+    submissions = "\n\n".join(
+        f"### REQ {i}\nLanguage: {request.language}\nFocus: {', '.join(request.focus_areas)}\nCode:\n{_clip(request.code)}"
+        for i, (request, _) in enumerate(batch, 1)
+    )
+    max_tokens = min(sum(_max_tokens(request.code, floor=600) for request, _ in batch), 8000)
+    try:
+        async with _groq_slot(REVIEW_BATCH_SYSTEM_PROMPT + submissions, max_tokens):
+            completion = await client.chat.completions.create(
+                messages=[
+                    {
+                        "role": "system",
+                        "content": REVIEW_BATCH_SYSTEM_PROMPT,
+                    },
+                    {
+                        "role": "user",
+                        "content": submissions,
+                    },
+                ],
+                model="llama-3.3-70b-versatile",
+                temperature=0.3,
+                max_tokens=max_tokens,
+                top_p=0.9,
+                response_format={"type": "json_object"},
+            )
+        entries = orjson.loads(completion.choices[0].message.content).get("reviews", [])
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        for _, fut in batch:
+            if not fut.done():
+                fut.set_exception(e)
+        return
 
-@app.post("/api/rewrite")
-async def rewrite_code(request: RewriteRequest):
-    print("DEBUG: Entered /api/rewrite")
+    responses = {}
+    for entry in entries:
+        try:
+            responses[int(entry["id"])] = ReviewResult.model_validate(entry)
+        except (KeyError, TypeError, ValueError):
+            continue
+
+    for i, (request, fut) in enumerate(batch, 1):
+        review = responses.get(i)
+        if review is None:
+            # Model skipped or mangled this submission; review it on its own instead
+            _spawn_batch([(request, fut)])
+            continue
+        if not fut.done():
+            fut.set_result(_review_payload(review))
+
+async def _submit_review(request: ReviewRequest):
+    fut = asyncio.get_running_loop().create_future()
+    await _review_queue.put((request, fut))
+    return await fut
+
+@app.post("/api/review", dependencies=[Depends(_rate_limit)])
+async def review_code(request: ReviewRequest):
     try:
-        # Validate input
-        if not request.code or not request.code.strip():
-             raise HTTPException(status_code=400, detail="Code cannot be empty")
+        key = _cache_key("review", request.code, request.language, request.focus_areas)
+        generate = _submit_review if _review_queue is not None else _generate_review
+        parsed_review = await _cached(key, lambda: generate(request))
+        return parsed_review
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Fan-out cap for one /api/review_batch call; the global _GROQ_SEM still applies on top
+GROQ_MAX_PARALLEL = int(os.environ.get("GROQ_MAX_PARALLEL", "16"))
+# Never above the per-IP bucket size, since a batch costing more than a full bucket could never be admitted
+REVIEW_BATCH_LIMIT = min(20, RATE_LIMIT_PER_MINUTE)
+
+@app.post("/api/review_batch")
+async def review_code_batch(items: List[ReviewRequest], http_request: Request):
+    """
+    Reviews several snippets concurrently. A failed item is reported in place instead of failing the batch.
+    """
+    if len(items) > REVIEW_BATCH_LIMIT:
+        raise HTTPException(status_code=400, detail=f"At most {REVIEW_BATCH_LIMIT} items per batch")
+    # Each item can start its own Groq review, so it costs the same as a separate /api/review call
+    _charge_rate_limit(http_request, max(1, len(items)))
+
+    sem = asyncio.Semaphore(GROQ_MAX_PARALLEL)
+    generate = _submit_review if _review_queue is not None else _generate_review
+
+    async def review_one(request: ReviewRequest):
+        key = _cache_key("review", request.code, request.language, request.focus_areas)
+        async with sem:
+            return await _cached(key, lambda: generate(request))
 
-        prompt = f"""You are an expert software architect.
-Rewrite the following {request.language} code to:
+    results = await asyncio.gather(*(review_one(request) for request in items), return_exceptions=True)
+    return [{"error": str(result)} if isinstance(result, Exception) else result for result in results]
+
+REWRITE_SYSTEM_PROMPT = """You are an expert software architect.
+Rewrite the code in the user message to:
 
 - Fix all bugs
 - Improve performance
@@ -142,85 +602,211 @@ Provide output in this format:
 ```
 
 Improvements:
-(list improvements here)
-
-Code:
-{request.code}
-"""
-        completion = client.chat.completions.create(
-            messages=[
-                {
-                    "role": "user",
-                    "content": prompt,
-                }
-            ],
+(list improvements here)"""
+
+# First fenced code block in a rewrite response
+_CODE_FENCE = re.compile(r"```[^\n]*\n(.*?)```", re.DOTALL)
+
+def _rewrite_messages(request: RewriteRequest):
+    return [
+        {
+            "role": "system",
+            "content": REWRITE_SYSTEM_PROMPT,
+        },
+        {
+            "role": "user",
+            "content": f"Language: {request.language}\nCode:\n{_clip(request.code)}",
+        },
+    ]
+
+def _rewrite_result(response_text: str):
+    logger.debug("Rewrite LLM response length: %d", len(response_text))
+    
+    # Robust extraction logic
+    rewritten_code = response_text
+    improvements = "See rewritten code for details."
+    
+    matches = _CODE_FENCE.findall(response_text)
+    
+    if matches:
+        # Assume the largest block is the code, or the first one.
+        # Usually the first one is the implementation.
+        rewritten_code = matches[0]
+        
+        # Remove the code block from text to find improvements
+        improvements_text = _CODE_FENCE.sub("", response_text).strip()
+        if improvements_text:
+            improvements = improvements_text
+    
+    return {
+        "rewritten_code": rewritten_code.strip(),
+        "improvements": improvements.strip()
+    }
+
+async def _generate_rewrite(request: RewriteRequest):
+    messages = _rewrite_messages(request)
+    max_tokens = _max_tokens(request.code, floor=500)
+    async with _groq_slot(_prompt_text(messages), max_tokens):
+        completion = await client.chat.completions.create(
+            messages=messages,
             model="llama-3.3-70b-versatile",
             temperature=0.3,
-            max_tokens=2000,
+            max_tokens=max_tokens,
             top_p=0.9,
         )
-        
-        response_text = completion.choices[0].message.content
-        print(f"DEBUG: Rewrite LLM Response length: {len(response_text)}")
-        
-        # Robust extraction logic
-        rewritten_code = response_text
-        improvements = "See rewritten code for details."
-        
-        # Try to extract code block
-        code_match = re.search(r"```(?:(\w+)\n)?(.*?)```", response_text, re.DOTALL)
-        if code_match:
-             # If there are two groups (lang, code) or just code. 
-             # The regex `(?:(\w+)\n)?` captures optional language identifier.
-             # `(.*?)` captures the code.
-             # behavior depends on if lang identifier is present.
-             # re.search returns groups.
-             # If `(?:...)` is non-capturing group for the outer part? No, `(\w+)` is capturing inside.
-             # Let's use a simpler regex to be safe and consistent with previous working regex but improved.
-             pass
-
-        # Better Regex
-        code_pattern = re.compile(r"```(?:\w+)?\n(.*?)```", re.DOTALL)
-        matches = code_pattern.findall(response_text)
-        
-        if matches:
-            # Assume the largest block is the code, or the first one.
-            # Usually the first one is the implementation.
-            rewritten_code = matches[0]
-            
-            # Remove the code block from text to find improvements
-            improvements_text = code_pattern.sub("", response_text).strip()
-            if improvements_text:
-                improvements = improvements_text
-        
-        return JSONResponse(content={
-            "rewritten_code": rewritten_code.strip(),
-            "improvements": improvements.strip()
-        })
+    
+    return _rewrite_result(completion.choices[0].message.content)
+
+@app.post("/api/rewrite", dependencies=[Depends(_rate_limit)])
+async def rewrite_code(request: RewriteRequest):
+    logger.debug("Entered /api/rewrite")
+    try:
+        # Validate input
+        if not request.code or not request.code.strip():
+             raise HTTPException(status_code=400, detail="Code cannot be empty")
+
+        key = _cache_key("rewrite", request.code, request.language, request.focus_areas)
+        result = await _cached(key, lambda: _generate_rewrite(request))
+        return result
 
     except Exception as e:
-        import traceback
-        import sys
-        print(f"DEBUG: Exception in /api/rewrite: {repr(e)}")
-        traceback.print_exc()
+        logger.exception("/api/rewrite failed")
         
         error_msg = str(e)
         if "rate_limit_exceeded" in error_msg.lower():
-             return JSONResponse(status_code=429, content={"detail": "AI Service Rate Limit Exceeded. Please try again later."})
+             return ORJSONResponse(status_code=429, content={"detail": "AI Service Rate Limit Exceeded. Please try again later."})
         
-        return JSONResponse(status_code=500, content={"detail": f"Internal Server Error: {error_msg}"})
+        return ORJSONResponse(status_code=500, content={"detail": f"Internal Server Error: {error_msg}"})
 
-@app.post("/api/score")
-async def evaluate_score(request: ScoreRequest):
-    print("DEBUG: Entered /api/score")
-    try:
-        # Input Validation
-        if not request.code or not request.code.strip():
-             raise HTTPException(status_code=400, detail="Code cannot be empty")
+# --- Streaming Endpoints ---
+
+# Replies longer than this (in chars) are parsed in the threadpool instead of on the event loop
+THREADPOOL_PARSE_THRESHOLD = 32_000
+
+def _sse(payload: dict) -> bytes:
+    return b"data: " + orjson.dumps(payload) + b"\n\n"
+
+class _ReviewSectionScanner:
+    """
+    Emits each review section as soon as the next header arrives. Each delta is searched once, plus a short
+    carried-over tail in case a header straddles two deltas, so the work stays linear in the reply length.
+    """
+
+    def __init__(self):
+        self._body = []
+        self._tail = ""
+        self._open = None
+        self._seen = set()
+
+    def feed(self, content: str):
+        text = self._tail + content
+        events = []
+        pos = 0
+        for match in _SECTION_SPLIT.finditer(text):
+            self._body.append(text[pos:match.start()])
+            self._close(events)
+            self._open = _SECTION_KEYS[match.group(0)]
+            pos = match.end()
+        # Anything before the last (longest header - 1) chars can no longer be the start of a header
+        keep = max(pos, len(text) - (_SECTION_HEADER_MAX - 1))
+        self._body.append(text[pos:keep])
+        self._tail = text[keep:]
+        return events
+
+    def finish(self):
+        """Flushes the last open section (normally the summary) once the stream has ended."""
+        events = []
+        self._body.append(self._tail)
+        self._tail = ""
+        self._close(events)
+        self._open = None
+        return events
+
+    def _close(self, events: list):
+        key = self._open
+        body = "".join(self._body)
+        self._body = []
+        # Text before the first header is dropped; like parse_review_response, only the first occurrence of a header counts
+        if key is None or key in self._seen:
+            return
+        self._seen.add(key)
+        content = body.strip() if key == "summary" else _BULLET_SPLIT.findall(body)
+        events.append({"type": "section", "section": key, "content": content})
+
+async def _stream_completion(key: str, messages, finalize, max_tokens: int, scanner=None, temperature=0.3, top_p=0.9):
+    """
+    Yields server-sent events: one "delta" per generated chunk, then the parsed "result".
+    With a scanner, completed sections are also emitted as "section" events along the way.
+    Cached results are replayed as a single "result" event.
+    """
+    if key in _response_cache:
+        yield _sse({"type": "result", **_response_cache[key]})
+        return
 
-        system_prompt = f"""You are a strict senior software engineer and technical interviewer.
+    chunks = []
+    try:
+        async with _groq_slot(_prompt_text(messages), max_tokens):
+            stream = await client.chat.completions.create(
+                messages=messages,
+                model="llama-3.3-70b-versatile",
+                temperature=temperature,
+                max_tokens=max_tokens,
+                top_p=top_p,
+                stream=True,
+            )
+            async for chunk in stream:
+                content = chunk.choices[0].delta.content
+                if content:
+                    chunks.append(content)
+                    yield _sse({"type": "delta", "content": content})
+                    if scanner:
+                        for event in scanner.feed(content):
+                            yield _sse(event)
+
+        if scanner:
+            for event in scanner.finish():
+                yield _sse(event)
+
+        # Only large replies are worth the threadpool hop; typical ones parse faster than the dispatch costs
+        text = "".join(chunks)
+        if len(text) > THREADPOOL_PARSE_THRESHOLD:
+            result = await run_in_threadpool(finalize, text)
+        else:
+            result = finalize(text)
+        _response_cache[key] = result
+        yield _sse({"type": "result", **result})
 
-Your job is to critically evaluate the following {request.language} code.
+    except Exception as e:
+        yield _sse({"type": "error", "detail": str(e)})
+
+@app.post("/api/review/stream", dependencies=[Depends(_rate_limit)])
+async def review_code_stream(request: ReviewRequest):
+    key = _cache_key("review", request.code, request.language, request.focus_areas)
+    return StreamingResponse(
+        _stream_completion(
+            key,
+            _review_messages(request),
+            _review_result,
+            _max_tokens(request.code, floor=600),
+            scanner=_ReviewSectionScanner(),
+        ),
+        media_type="text/event-stream",
+    )
+
+@app.post("/api/rewrite/stream", dependencies=[Depends(_rate_limit)])
+async def rewrite_code_stream(request: RewriteRequest):
+    if not request.code or not request.code.strip():
+        raise HTTPException(status_code=400, detail="Code cannot be empty")
+    key = _cache_key("rewrite", request.code, request.language, request.focus_areas)
+    return StreamingResponse(
+        _stream_completion(key, _rewrite_messages(request), _rewrite_result, _max_tokens(request.code, floor=500)),
+        media_type="text/event-stream",
+    )
+
+# Static so the provider can reuse the cached prefix across score calls
+SCORE_SYSTEM_PROMPT = """You are a strict senior software engineer and technical interviewer.
+
+Your job is to critically evaluate the code in the user message.
 
 IMPORTANT RULES:
 1. NEVER give 100% unless the code is PERFECT.
@@ -240,7 +826,7 @@ Evaluate based on:
 - Efficiency (10%)
 
 Return output as a single valid JSON object. Do not wrap in markdown code blocks. Do not add explanations outside the JSON.
-{{
+{
 "performance_score": number, // Score 0-100 based on Efficiency
 "security_score": number, // Score 0-100 based on Logic and Correctness
 "readability_score": number, // Score 0-100 based on Readability
@@ -249,7 +835,7 @@ Return output as a single valid JSON object. Do not wrap in markdown code blocks
 "time_complexity": "string",
 "space_complexity": "string",
 "reasoning_summary": "string" // MUST contain the detailed text report below
-}}
+}
 
 For `reasoning_summary`, provide a string formatted exactly like this (use \\n for newlines):
 
@@ -265,101 +851,102 @@ Efficiency: X/10
 REASONS FOR DEDUCTIONS:
 - [point 1]
 - [point 2]
-...
-
-Programming Language:
-{request.language}
-
-Code:
-{request.code}
-"""
-        completion = client.chat.completions.create(
-            messages=[
-                {
-                    "role": "user",
-                    "content": system_prompt,
-                }
-            ],
+..."""
+
+# The score JSON plus its short report fits well under this
+SCORE_MAX_TOKENS = 512
+
+def _score_messages(request: ScoreRequest):
+    return [
+        {
+            "role": "system",
+            "content": SCORE_SYSTEM_PROMPT,
+        },
+        {
+            "role": "user",
+            "content": f"Programming Language: {request.language}\nCode:\n{_clip(request.code)}",
+        },
+    ]
+
+_JSON_DECODER = json.JSONDecoder()
+
+def _score_result(response_text: str):
+    logger.debug("Score LLM response: %s", response_text)
+    
+    score_data = None
+    try:
+        score_data = orjson.loads(response_text)
+    except orjson.JSONDecodeError:
+        # Robust JSON extraction: decode the first complete object, skipping any prose or fences around it
+        start_idx = response_text.find('{')
+        while start_idx != -1:
+            try:
+                score_data, _ = _JSON_DECODER.raw_decode(response_text, start_idx)
+                break
+            except json.JSONDecodeError:
+                start_idx = response_text.find('{', start_idx + 1)
+    
+    if not score_data:
+         logger.warning("Failed to parse score JSON. Raw: %s", response_text)
+         raise ValueError("Failed to parse JSON response from LLM")
+         
+    # Normalize fields if needed (LLM sometimes misses keys)
+    required_keys = ["performance_score", "security_score", "readability_score", "maintainability_score", 
+                     "overall_score", "time_complexity", "space_complexity", "reasoning_summary"]
+    
+    for key in required_keys:
+        if key not in score_data:
+            score_data[key] = "N/A" if "complexity" in key or "summary" in key else 0
+    
+    return score_data
+
+async def _generate_score(request: ScoreRequest):
+    messages = _score_messages(request)
+    async with _groq_slot(_prompt_text(messages), SCORE_MAX_TOKENS):
+        completion = await client.chat.completions.create(
+            messages=messages,
             model="llama-3.3-70b-versatile",
             temperature=0.2,
-            max_tokens=1000,
+            max_tokens=SCORE_MAX_TOKENS,
             top_p=0.85,
         )
-        
-        response_text = completion.choices[0].message.content
-        print(f"DEBUG: Score LLM Response: {response_text}")
-        
-        score_data = None
-        import json
-        try:
-            score_data = json.loads(response_text)
-        except json.JSONDecodeError:
-            # Robust JSON extraction
-            try:
-                # Find start and end of JSON object
-                start_idx = response_text.find('{')
-                end_idx = response_text.rfind('}')
-                
-                if start_idx != -1 and end_idx != -1:
-                    json_str = response_text[start_idx : end_idx + 1]
-                    score_data = json.loads(json_str)
-            except Exception:
-                pass
-        
-        if not score_data:
-             print(f"DEBUG: Failed to parse JSON. Raw: {response_text}")
-             raise ValueError("Failed to parse JSON response from LLM")
-        
-        if not score_data:
-             raise ValueError("Failed to parse JSON response from LLM")
-             
-        # Normalize fields if needed (LLM sometimes misses keys)
-        required_keys = ["performance_score", "security_score", "readability_score", "maintainability_score", 
-                         "overall_score", "time_complexity", "space_complexity", "reasoning_summary"]
-        
-        for key in required_keys:
-            if key not in score_data:
-                score_data[key] = "N/A" if "complexity" in key or "summary" in key else 0
-        
-        return JSONResponse(content=score_data)
+    
+    return _score_result(completion.choices[0].message.content)
+
+@app.post("/api/score", dependencies=[Depends(_rate_limit)])
+async def evaluate_score(request: ScoreRequest):
+    logger.debug("Entered /api/score")
+    try:
+        # Input Validation
+        if not request.code or not request.code.strip():
+             raise HTTPException(status_code=400, detail="Code cannot be empty")
+
+        key = _cache_key("score", request.code, request.language, None)
+        return await _cached(key, lambda: _generate_score(request))
 
     except Exception as e:
-        import traceback
-        import sys
-        print(f"DEBUG: Exception in /api/score: {repr(e)}")
-        traceback.print_exc()
+        logger.exception("/api/score failed")
         
         error_msg = str(e)
         if "rate_limit_exceeded" in error_msg.lower():
-            return JSONResponse(status_code=429, content={"detail": "AI Service Rate Limit Exceeded. Please try again later."})
+            return ORJSONResponse(status_code=429, content={"detail": "AI Service Rate Limit Exceeded. Please try again later."})
         
-        return JSONResponse(status_code=500, content={"detail": f"Internal Server Error: {error_msg}"})
+        return ORJSONResponse(status_code=500, content={"detail": f"Internal Server Error: {error_msg}"})
 
-@app.post("/api/chat")
-async def chat_assistant(request: ChatRequest):
-    try:
-        if not request.message:
-            raise HTTPException(status_code=400, detail="Message is required")
-
-        # --- 1. CONTEXT GATING MECHANISM ---
-        # Only include code context if the user actually refers to it.
-        # This prevents the model from obsessing over the code when the user asks a general question.
-        triggers = ["this code", "above code", "my code", "the bug", "fix this", "why is this"]
-        include_context = False
-        
-        # Check if message contains any trigger phrase (case-insensitive)
-        if any(trigger in request.message.lower() for trigger in triggers):
-            include_context = True
-        
-        # Also include context if the message is very short (likely referring to context implicitly like "fix it")
-        if len(request.message.split()) < 5:
-             include_context = True
+@app.post("/api/score/stream", dependencies=[Depends(_rate_limit)])
+async def evaluate_score_stream(request: ScoreRequest):
+    if not request.code or not request.code.strip():
+        raise HTTPException(status_code=400, detail="Code cannot be empty")
 
-        final_context_code = request.context_code if (include_context and request.context_code) else None
-        final_review_summary = request.review_summary if (include_context and request.review_summary) else None
+    key = _cache_key("score", request.code, request.language, None)
+    # The JSON is only parsed once the whole object has arrived, in the final "result" event
+    return StreamingResponse(
+        _stream_completion(key, _score_messages(request), _score_result, SCORE_MAX_TOKENS, temperature=0.2, top_p=0.85),
+        media_type="text/event-stream",
+    )
 
-        # --- 2. SYSTEM PROMPT ---
-        system_prompt = f"""You are an elite AI Coding Copilot comparable to ChatGPT and Gemini.
+# Static so the provider can reuse the cached prefix across chat calls
+CHAT_SYSTEM_PROMPT = """You are an elite AI Coding Copilot comparable to ChatGPT and Gemini.
 
 You must:
 - Be precise.
@@ -373,53 +960,93 @@ You must:
 - Adapt explanation depth automatically.
 - Use structured but concise formatting.
 
-Language Lock Rule:
-You MUST generate code only in the requested programming language: {request.language if request.language else "Unknown"}.
-If user did not request code, do NOT generate code.
-
 Precision Rule:
 If question is simple -> answer simply (3-5 lines).
 If question is advanced -> answer technically.
 Do not waste tokens on "Certainly!" or "Here is the code". Just give the answer.
 
-Programming Language: {request.language if request.language else "Not specified"}
+If no code context is provided, answer generally."""
+
+# Phrases that mean the user is asking about their own code
+_CTX_TRIGGERS = re.compile(r"this code|above code|my code|the bug|fix this|why is this", re.IGNORECASE)
+
+@app.post("/api/chat", dependencies=[Depends(_rate_limit)])
+async def chat_assistant(request: ChatRequest):
+    try:
+        if not request.message:
+            raise HTTPException(status_code=400, detail="Message is required")
 
-Code Context:
-{final_context_code if final_context_code else "No code context provided (answer generally)"}
+        # --- 1. CONTEXT GATING MECHANISM ---
+        # Only include code context if the user actually refers to it.
+        # This prevents the model from obsessing over the code when the user asks a general question.
+        # Include context if the message contains a trigger phrase (case-insensitive),
+        # or if it is very short (likely referring to context implicitly like "fix it")
+        include_context = bool(_CTX_TRIGGERS.search(request.message)) or len(request.message.split()) < 5
 
-Review Summary:
-{final_review_summary if final_review_summary else "N/A"}
+        final_context_code = request.context_code if (include_context and request.context_code) else None
+        final_review_summary = request.review_summary if (include_context and request.review_summary) else None
 
-User Question:
-{request.message}
-"""
+        # --- 2. PROMPT ---
+        # Only send the sections we actually have; the invariant rules live in CHAT_SYSTEM_PROMPT
+        language = request.language or "Unknown"
+        parts = [
+            f"Language Lock Rule:\nYou MUST generate code only in the requested programming language: {language}.\n"
+            "If user did not request code, do NOT generate code.",
+        ]
+        if final_context_code:
+            parts.append(f"Code Context:\n{final_context_code}")
+        if final_review_summary:
+            parts.append(f"Review Summary:\n{final_review_summary}")
+        parts.append(f"User Question:\n{request.message}")
+        user_prompt = "\n\n".join(parts)
+        # Short standalone questions get short answers; with code in context the reply may need to echo it
+        if final_context_code:
+            max_tokens = 1500
+        elif len(request.message.split()) < 20:
+            max_tokens = 512
+        else:
+            max_tokens = 1024
 
         # --- 3. STREAMING GENERATION ---
         async def generate_stream():
-            stream = client.chat.completions.create(
-                messages=[
-                    {"role": "user", "content": system_prompt}
-                ],
-                model="llama-3.3-70b-versatile",
-                temperature=0.15, # Low temp for precision
-                max_tokens=1500,
-                top_p=0.85,
-                stream=True
-            )
+            async with _groq_slot(CHAT_SYSTEM_PROMPT + user_prompt, max_tokens):
+                stream = await client.chat.completions.create(
+                    messages=[
+                        {"role": "system", "content": CHAT_SYSTEM_PROMPT},
+                        {"role": "user", "content": user_prompt},
+                    ],
+                    model="llama-3.3-70b-versatile",
+                    temperature=0.15, # Low temp for precision
+                    max_tokens=max_tokens,
+                    top_p=0.85,
+                    stream=True
+                )
             
-            for chunk in stream:
-                if chunk.choices[0].delta.content:
-                    yield chunk.choices[0].delta.content
+                async for chunk in stream:
+                    content = chunk.choices[0].delta.content
+                    if content:
+                        yield content
 
-        from fastapi.responses import StreamingResponse
         return StreamingResponse(generate_stream(), media_type="text/plain")
 
     except Exception as e:
-        print(f"Error: {e}") # Log error
+        logger.exception("chat_assistant failed")
         raise HTTPException(status_code=500, detail=str(e))
 
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+# Precompiled patterns for parse_review_response
+_SECTION_SPLIT = re.compile(r"(🔴 Critical Issues|🟠 High Priority|🟡 Medium Priority|🟢 Low Priority|📌 Overall Summary)")
+_SECTION_KEYS = {
+    "🔴 Critical Issues": "critical",
+    "🟠 High Priority": "high",
+    "🟡 Medium Priority": "medium",
+    "🟢 Low Priority": "low",
+    "📌 Overall Summary": "summary",
+}
+_SECTION_HEADER_MAX = max(map(len, _SECTION_KEYS))
+# Surrounding whitespace (any kind except newline) is excluded by the pattern itself, so matches need no strip();
+# the marker must be followed by whitespace (so "---" rules and "**bold**" lines aren't bullets)
+# and the capture must start with a non-space, so blank bullets are skipped
+_BULLET_SPLIT = re.compile(r"^[^\S\n]*[-*•][^\S\n]+(\S.*?)[^\S\n]*$", re.MULTILINE)
 
 def parse_review_response(review_text: str):
     """
@@ -432,37 +1059,36 @@ def parse_review_response(review_text: str):
         "low": [],
         "summary": ""
     }
-    
-    # Regex patterns for sections
-    critical_pattern = re.search(r"🔴 Critical Issues(.*?)(?=🟠|🟡|🟢|📌|$)", review_text, re.DOTALL)
-    high_pattern = re.search(r"🟠 High Priority(.*?)(?=🟡|🟢|📌|$)", review_text, re.DOTALL)
-    medium_pattern = re.search(r"🟡 Medium Priority(.*?)(?=🟢|📌|$)", review_text, re.DOTALL)
-    low_pattern = re.search(r"🟢 Low Priority(.*?)(?=📌|$)", review_text, re.DOTALL)
-    summary_pattern = re.search(r"📌 Overall Summary(.*?)$", review_text, re.DOTALL)
 
     def extract_bullets(text):
         if not text:
             return []
-        # Extract lines starting with hyphens, asterisks, or numbers
-        return [line.strip().lstrip("-*•").strip() for line in text.strip().split('\n') if line.strip().startswith(("-", "*", "•"))]
-
-    if critical_pattern:
-        sections["critical"] = extract_bullets(critical_pattern.group(1))
-    
-    if high_pattern:
-        sections["high"] = extract_bullets(high_pattern.group(1))
-
-    if medium_pattern:
-        sections["medium"] = extract_bullets(medium_pattern.group(1))
-
-    if low_pattern:
-        sections["low"] = extract_bullets(low_pattern.group(1))
-
-    if summary_pattern:
-        sections["summary"] = summary_pattern.group(1).strip()
+        # Extract lines starting with hyphens, asterisks, or bullets in one scan
+        return _BULLET_SPLIT.findall(text)
+
+    # Split once on the section headers: [preamble, header, body, header, body, ...]
+    parts = _SECTION_SPLIT.split(review_text)
+    seen = set()
+    for header, body in zip(parts[1::2], parts[2::2]):
+        key = _SECTION_KEYS[header]
+        if key in seen:
+            continue
+        seen.add(key)
+        if key == "summary":
+            sections["summary"] = body.strip()
+        else:
+            sections[key] = extract_bullets(body)
         
     return sections
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="127.0.0.1", port=8000)
+    # Multiple workers need the app as an import string; each worker imports this module and builds its own client
+    uvicorn.run(
+        "main:app",
+        host="127.0.0.1",
+        port=8000,
+        loop="asyncio" if sys.platform == "win32" else "uvloop",  # uvloop has no Windows build
+        http="httptools",
+        workers=WEB_CONCURRENCY,
+    )
@@ -13,11 +13,11 @@ def log(msg):
 
 def get_stream_content(response):
     """Helper to consume stream and return full text."""
-    content = ""
+    parts = []
     for chunk in response.iter_text():
         if chunk:
-            content += chunk
-    return content
+            parts.append(chunk)
+    return "".join(parts)
 
 def test_language_lock_python():
     log("\n--- Testing Python Language Lock (Streaming) ---")